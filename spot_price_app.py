@@ -5,11 +5,11 @@
 
 
 import pandas as pd
-from datetime import date
-import plotly.express as px
+import os
+import plotly.io as pio
 
-from dash import Dash, dcc, html
-from dash.dependencies import Output, Input
+from dash import Dash, dcc, html, dash_table
+from dash.dependencies import Output, Input, State
 
 
 # In[ ]:
@@ -58,8 +58,31 @@ load_figure_template('flatly')
 # In[ ]:
 
 
-# Import data
-df = pd.read_csv('2023_01_DayAheadPrices_12.1.D.csv', sep = '\t')
+CSV_FILE = '2023_01_DayAheadPrices_12.1.D.csv'
+
+# The cleaned data is stored as Parquet, so the CSV is only parsed when the cache is missing or outdated
+PARQUET_FILE = 'no_2023_01.parquet'
+use_parquet = os.path.exists(PARQUET_FILE) and os.path.getmtime(PARQUET_FILE) >= os.path.getmtime(CSV_FILE)
+
+# Import data (only the columns used by the app; the checks below need the full file)
+if use_parquet:
+    
+    # Rebuild the cache if it is damaged or was written with an older layout
+    try:
+        df = pd.read_parquet(PARQUET_FILE)
+        use_parquet = list(df.index.names) == ['MapCode', 'Day'] and df['Price'].dtype == 'float32'
+    except (OSError, ValueError, KeyError):
+        use_parquet = False
+
+if not use_parquet:
+    df = pd.read_csv(
+        CSV_FILE,
+        sep = '\t',
+        engine = 'pyarrow',
+        usecols = ['DateTime', 'MapCode', 'Price'],
+        parse_dates = ['DateTime'],
+        dtype = {'MapCode' : 'category', 'Price' : 'float32'}
+    )
 
 #df
 
@@ -111,58 +134,68 @@ df = pd.read_csv('2023_01_DayAheadPrices_12.1.D.csv', sep = '\t')
 # In[ ]:
 
 
-# Convert to datetime
-df['DateTime'] = pd.to_datetime(df['DateTime'])
-
-# Extract Norwegian bidding zones
-df = df[df['MapCode'].isin(['NO1', 'NO2', 'NO3', 'NO4', 'NO5'])].copy()
-
-# Create date column as string
-df['Day'] = df['DateTime'].dt.date.astype(str)
+if not use_parquet:
+    
+    # Extract Norwegian bidding zones
+    df = df[df['MapCode'].isin(['NO1', 'NO2', 'NO3', 'NO4', 'NO5'])].copy()
+    df['MapCode'] = df['MapCode'].cat.remove_unused_categories()
 
-#print(df['MapCode'].nunique())
+    # Create date column as string
+    df['Day'] = df['DateTime'].dt.strftime('%Y-%m-%d')
+    
+    # Sort on time and index by bidding zone and day, so df.loc[(area, day)] gives the (time-sorted) subset
+    df = df.sort_values(['MapCode', 'Day', 'DateTime']).set_index(['MapCode', 'Day'])
+    
+    # Store the cleaned data for the next start. It is written to a temporary file (one per process) and then moved into place,
+    # so a partly written cache is never read. If the directory is read-only, carry on without the cache.
+    tmp_file = f'{PARQUET_FILE}.{os.getpid()}.tmp'
+    try:
+        df.to_parquet(tmp_file)
+        os.replace(tmp_file, PARQUET_FILE)
+    except OSError:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+#print(df.index.get_level_values('MapCode').nunique())
 #print(df['DateTime'].nunique())
 #df
 
 
-# The function `plot_price` takes a day (as a string) and the map code of a bidding zone, and returns a line plot that replicates as close as possible the step chart in the ENTSO-E dashboard. 
+# The plot replicates as close as possible the step chart in the ENTSO-E dashboard. `FIGURE` holds its trace style and layout as a plain dict, which avoids building and validating a Plotly figure object; the clientside callback below fills in the prices for the selected bidding zone and day.
 
 # In[ ]:
 
 
-def plot_price(day, area, data = df):
-    
-    # Extract subset
-    subset = data[(data['MapCode'] == area) & (data['Day'] == day)].copy()  
+# Figure layout and trace style (the theme template is included explicitly, since it is not applied to plain dicts)
+FIGURE = {
+    'data' : [{'type' : 'scatter', 'mode' : 'lines', 'name' : '', 'line' : {'shape' : 'hv'}, 'hovertemplate' : 'PT60M: %{y}'}],
+    'layout' : {
+        'template' : pio.templates['flatly'].to_plotly_json(),
+        'title' : {'text' : 'Day-ahead prices', 'x' : 0.5},
+        'xaxis' : {'title' : {'text' : 'Time [Hours]'}, 'tickformat' : '%H:%M'},
+        'yaxis' : {'title' : {'text' : 'Price per MTU [EUR / MWh]'}},
+        'hovermode' : 'x unified'
+    }
+}
 
-    # Sort on time and set as index 
-    subset.sort_values('DateTime', inplace = True)
-    subset.set_index('DateTime', inplace = True)
-    
-    # Create the desired time range and resample with forward fill
-    t_index = pd.DatetimeIndex(pd.date_range(start = subset.index.min(), end = subset.index.max() + pd.Timedelta(minutes = 59), freq = '15min'))
-    subset = subset.reindex(t_index, method = 'ffill')
-
-    fig = px.line(
-        subset,
-        y = 'Price',
-        line_shape = 'hv'
-    ) 
-
-    fig.update_layout(
-        title = 'Day-ahead prices', 
-        title_x = 0.5,
-        xaxis_title = 'Time [Hours]',
-        yaxis_title = 'Price per MTU [EUR / MWh]',
-        xaxis_tickformat = '%H:%M',
-        hovermode = 'x unified',
-    )
-    
-    fig.update_traces(hovertemplate = 'PT60M: %{y}') 
-    
-    return fig
 
-#plot_price('2023-01-31', 'NO3')
+# The dataset is small, so all prices are sent to the browser once and the plot and table are updated by a clientside callback, without a round-trip to the server. The store holds the figure without its data, the "MTU" labels used in the ENTSO-E dashboard and the hourly prices for each bidding zone and day. The prices for a day are stored in 24 slots, one per hour (`None` for a missing hour), so the time of each price is built in the browser from the day and the "MTU" label of its slot.
+
+# In[ ]:
+
+
+# "MTU" label for each hour of the day, e.g. '23:00 - 00:00'
+MTU_LABELS = [f'{h:02d}:00 - {(h + 1) % 24:02d}:00' for h in range(24)]
+
+# Hourly prices for each bidding zone and day, placed by hour (prices are stored as float32, so they are rounded back to cents)
+prices = {}
+for (area, day), subset in df.groupby(level = ['MapCode', 'Day'], sort = False, observed = True):
+    hourly = [None] * 24
+    for hour, price in zip(subset['DateTime'].dt.hour.tolist(), subset['Price'].astype(float).round(2).tolist()):
+        hourly[hour] = price
+    prices.setdefault(area, {})[day] = hourly
+
+store = dcc.Store(id = 'prices', data = {'figure' : FIGURE, 'mtu' : MTU_LABELS, 'prices' : prices})
 
 
 # ### Application
@@ -172,34 +205,47 @@ def plot_price(day, area, data = df):
 # In[ ]:
 
 
-# Single date picker to select day
-datepicker = dcc.DatePickerSingle(
+# Bidding zones that can be selected
+AREA_OPTIONS = (
+    {'label' : 'East coast', 'value' : 'NO1'},
+    {'label' : 'South coast', 'value' : 'NO2'},
+    {'label' : 'Central Norway', 'value' : 'NO3'},
+    {'label' : 'Northern Norway', 'value' : 'NO4'},
+    {'label' : 'West coast', 'value' : 'NO5'}
+)
+
+# Dropdown to select day (the selection is kept on reload)
+datepicker = dcc.Dropdown(
     id = 'my_date',
-    min_date_allowed = df['DateTime'].min().date(),       
-    max_date_allowed = df['DateTime'].max().date(),       
-    date = date(2023, 1, 1)
+    options = [{'label' : day, 'value' : day} for day in sorted(df.index.get_level_values('Day').unique())],
+    value = '2023-01-01',
+    clearable = False,
+    persistence = True
 )
 
-# Radio buttons to select bidding zone
+# Radio buttons to select bidding zone (the selection is kept on reload)
 areapicker = dcc.RadioItems(
     id = 'my_area',
-    options = [
-        {'label' : 'East coast', 'value' : 'NO1'},
-        {'label' : 'South coast', 'value' : 'NO2'},
-        {'label' : 'Central Norway', 'value' : 'NO3'},
-        {'label' : 'Northern Norway', 'value' : 'NO4'},
-        {'label' : 'West coast', 'value' : 'NO5'}
-    ],
-    value = 'NO1'
+    options = list(AREA_OPTIONS),
+    value = 'NO1',
+    persistence = True
 )
 
 
 # In[ ]:
 
 
+# Table with the hourly price, filled in by the callback
+table = dash_table.DataTable(
+    id = 'my_table',
+    columns = [{'name' : c, 'id' : c} for c in ['MTU', 'Day-ahead price']],
+    style_as_list_view = True,
+    style_data_conditional = [{'if' : {'row_index' : 'odd'}, 'backgroundColor' : 'rgba(0, 0, 0, 0.05)'}]
+)
+
 tabs = dbc.Tabs(
     children = [
-        dbc.Tab([html.Br(), dbc.Container(id = 'my_table')], label = 'Table'),
+        dbc.Tab([html.Br(), dbc.Container(table)], label = 'Table'),
         dbc.Tab(dcc.Graph(id = 'my_plot'), label = 'Plot')
     ]
 )
@@ -226,6 +272,9 @@ app.layout = dbc.Container(
                 
         html.Br(),
         
+        # Prices for the clientside callback
+        store,
+        
         # Row with two columns for selectors and tab structure
         dbc.Row(
             children = [
@@ -240,44 +289,50 @@ app.layout = dbc.Container(
 )
 
 
-@app.callback(
+app.clientside_callback(
+    """
+    function(day, area, store) {
+        
+        const prices = (store.prices[area] || {})[day];
+        if (prices === undefined) {
+            throw window.dash_clientside.PreventUpdate;
+        }
+        
+        // Step chart points at the start of each hour (a missing hour leaves a gap). If the next hour has no price, the price
+        // is repeated at the end of its hour so its step is drawn.
+        const x = [];
+        const y = [];
+        prices.forEach((price, i) => {
+            const prefix = day + ' ' + store.mtu[i].slice(0, 2);
+            x.push(prefix + ':00');
+            y.push(price);
+            if (price !== null && (i + 1 === prices.length || prices[i + 1] === null)) {
+                x.push(prefix + ':45');
+                y.push(price);
+            }
+        });
+        
+        // Fill the stored figure with the step chart points
+        const figure = {
+            data: [Object.assign({}, store.figure.data[0], {x: x, y: y})],
+            layout: store.figure.layout
+        };
+        
+        // One row per hour with a price
+        const table = prices.map((price, i) => ({
+            'MTU': store.mtu[i],
+            'Day-ahead price': price
+        })).filter(row => row['Day-ahead price'] !== null);
+        
+        return [figure, table];
+    }
+    """,
     Output('my_plot', 'figure'),
-    Input('my_date', 'date'),
-    Input('my_area', 'value')
+    Output('my_table', 'data'),
+    Input('my_date', 'value'),
+    Input('my_area', 'value'),
+    State('prices', 'data')
 )
-def update_plot(day, area):
-    
-    return plot_price(day, area)
-
-
-@app.callback(
-    Output('my_table', 'children'),
-    Input('my_date', 'date'),
-    Input('my_area', 'value')
-)
-def update_table(day, area, data = df):
-
-    # Extract subset
-    subset = data[(data['MapCode'] == area) & (data['Day'] == day)].copy() 
-    
-    # Sort on date
-    subset.sort_values('DateTime', inplace = True)
-    
-    # Reset index and rename columns
-    subset = subset.reset_index().rename(columns = {'Price' : 'Day-ahead price'})
-
-    # Drop date from timestamp
-    subset['DateTime'] = subset['DateTime'].dt.strftime('%H:%M')
-
-    # Create the same "MTU" column as in the ENTSO-E dashboard
-    subset['temp'] = subset['DateTime'].shift(-1)
-    subset.fillna('00:00', inplace = True)
-    subset['MTU'] = subset['DateTime'] + ' - ' + subset['temp']
-
-    # Keep only MTU and price column
-    subset = subset[['MTU', 'Day-ahead price']].copy()
-
-    return dbc.Table.from_dataframe(subset, striped = True, bordered = True, hover = True)
 
 
 if __name__ == '__main__':